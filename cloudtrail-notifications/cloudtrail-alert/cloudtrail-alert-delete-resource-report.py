@@ -1,16 +1,35 @@
 import boto3
 import datetime
 import json
+import logging
 import os
 import urllib3
+from operator import itemgetter
 from athena_from_s3 import AthenaHelper
+from botocore.config import Config
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+client_config = Config(tcp_keepalive=True, max_pool_connections=50, retries={'mode': 'standard'})
+
+session = boto3.Session()
+athena_helper = AthenaHelper()
+ses = session.client('ses', config=client_config)
+event_fields = itemgetter("eventtime", "user", "account", "region", "eventsource", "eventname")
+slack_max_message_length = 40000
+http = urllib3.PoolManager()
+slack_webhook = os.environ["slack_webhook"]
+slack_channel = os.environ["slack_channel"]
+slack_headers = {"Content-Type": "application/json"}
+email_html_header = "<html><body><h1>AWS - Resource deletion report</h1><p>Hi,</p><p>Here are deletion actions done yesterday:</p><table border=\"1\" style=\"border-collapse : collapse; border: 2px solid; \"><tr><th>Event time</th><th>User</th><th>Account</th><th>Region</th><th>Event source</th><th>Event name</th></tr></thead><tbody>"
+email_html_footer = "<tbody></table></body></html>"
+email_txt_header = "AWS - Resource deletion report\n\nHi,\n\nHere are deletion actions done yesterday:\n\n"
 
 def lambda_handler(event, context):
 
     print("1) Query cloudtrail")
 
-    athena_helper = AthenaHelper()
-
     today = datetime.date.today()
     yesterday = today - datetime.timedelta(days=1)
 
@@ -19,20 +38,19 @@ def lambda_handler(event, context):
         "database": "default",
         "bucket": os.environ["s3_query_results_bucket"],
         "path": "temp/athena/output",
+        "result_reuse_minutes": 1440,
         "query": f'select eventtime, \
-                useridentity.arn as user \
+                useridentity.arn as user, \
                 account, \
                 region, \
                 eventsource, \
                 eventname \
                 FROM "default"."cloudtrail_logs" \
                 WHERE "timestamp" = \'{yesterday.strftime("%Y/%m/%d")}\' \
-                    AND (lower(eventName) like \'%delete%\' OR lower(eventName) like \'%remove%\') \
+                    AND regexp_like(eventname, \'Delete|Remove\') \
                 order by eventtime',
     }
 
-    session = boto3.Session()
-
     ## Fucntion for obtaining query results and location
     location, data = athena_helper.query_results(session, params)
 
@@ -43,18 +61,12 @@ def lambda_handler(event, context):
 
 def send_email(data):
 
-    ses = boto3.client('ses')
-
     sender = os.environ["email_sender"]
     recipients = [ os.environ["email_recipient"] ]
 
     html, txt = build_email_content(data)
 
-    print("--------------------------------------------------")
-    print(f"HTML: {html}")
-    print("--------------------------------------------------")
-    print(f"TXT: {txt}")
-    print("--------------------------------------------------")
+    logger.debug("html_len=%d txt_len=%d", len(html), len(txt))
 
     response = ses.send_email(
         Source=sender,
@@ -77,53 +89,58 @@ def send_email(data):
         }
     )
 
-    print(response)
+    logger.info("ses_message_id=%s", response["MessageId"])
 
 def build_email_content(data):
-    html = f"<html><body><h1>AWS - Resource deletion report</h1><p>Hi,</p><p>Here are deletion actions done yesterday:</p><table border=\"1\" style=\"border-collapse : collapse; border: 2px solid; \"><tr><th>Event time</th><th>User</th><th>Account</th><th>Region</th><th>Event source</th><th>Event name</th></tr></thead><tbody>"
-    txt = f"AWS - Resource deletion report\n\nHi,\n\nHere are deletion actions done yesterday:\n\n"
+    html = [email_html_header]
+    txt = [email_txt_header]
     
     for result in data:
-        event_time = result["eventtime"]
-        user = result["user"]
-        account_id = result["account"]
-        region = result["region"]
-        event_source = result["eventsource"]
-        event_name = result["eventname"]
+        event_time, user, account_id, region, event_source, event_name = event_fields(result)
 
-        html += f"<tr><td>{event_time}</td><td>{user}</td><td>{account_id}</td><td>{region}</td><td>{event_source}</td><td>{event_name}</td></tr>"
-        txt += f"{event_time} - {user} - {account_id} - {region} - {event_source} - {event_name}\n"
+        html.append(f"<tr><td>{event_time}</td><td>{user}</td><td>{account_id}</td><td>{region}</td><td>{event_source}</td><td>{event_name}</td></tr>")
+        txt.append(f"{event_time} - {user} - {account_id} - {region} - {event_source} - {event_name}\n")
 
-    html += "<tbody></table></body></html>"
+    html.append(email_html_footer)
 
-    return html, txt
+    return "".join(html), "".join(txt)
 
 
 def send_slack_notification(data):
 
+    messages = []
+    lines = []
+    length = 0
+
     for result in data:
-        event_time = result["eventtime"]
-        user = result["user"]
-        account_id = result["account"]
-        region = result["region"]
-        event_source = result["eventsource"]
-        event_name = result["eventname"]
+        event_time, user, account_id, region, event_source, event_name = event_fields(result)
 
-        text = f"{event_time} | Resource deletion alert : {user} deleted a resource in {region} in the account {account_id} with the event {event_source}/{event_name}"
+        line = f"{event_time} | Resource deletion alert : {user} deleted a resource in {region} in the account {account_id} with the event {event_source}/{event_name}"
 
+        ## one message per batch of lines, split to stay under the Slack text limit
+        if lines and length + len(line) + 1 > slack_max_message_length:
+            messages.append("\n".join(lines))
+            lines = []
+            length = 0
+
+        lines.append(line)
+        length += len(line) + 1
+
+    if lines:
+        messages.append("\n".join(lines))
+
+    for text in messages:
         post_message_to_slack(text)
 
 def post_message_to_slack(text,):
 
-    http = urllib3.PoolManager()
-
-    body = {"channel": os.environ["slack_channel"], "text": text}
+    body = {"channel": slack_channel, "text": text}
 
     response = http.request(
         "POST",
-        os.environ["slack_webhook"],
+        slack_webhook,
         body=json.dumps(body),
-        headers={"Content-Type": "application/json"},
+        headers=slack_headers,
     )
 
     print(response.data)
\ No newline at end of file
@@ -1,76 +1,131 @@
+import codecs
+import csv
 import time
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+client_config = Config(
+    tcp_keepalive=True, max_pool_connections=50, retries={"mode": "standard"}
+)
 
 
 class AthenaHelper:
+    def __init__(self):
+        # Clients are created on first use and reused by later queries,
+        # keyed on the session itself so it stays alive with its clients
+        self.clients = {}
+
+    def get_client(self, session, service_name):
+        key = (session, service_name)
+        if key not in self.clients:
+            self.clients[key] = session.client(service_name, config=client_config)
+        return self.clients[key]
+
     def get_var_char_values(self, d):
         return [obj["VarCharValue"] for obj in d["Data"]]
 
+    def get_csv_results(self, session, location):
+        # Read the CSV Athena wrote to S3 instead of paging through GetQueryResults
+        bucket, key = location.replace("s3://", "", 1).split("/", 1)
+        s3 = self.get_client(session, "s3")
+        response = s3.get_object(Bucket=bucket, Key=key)
+        reader = csv.DictReader(codecs.getreader("utf-8")(response["Body"]))
+        return list(reader)
+
+    def get_api_results(self, client, query_execution_id):
+        response_query_result = client.get_query_results(
+            QueryExecutionId=query_execution_id
+        )
+        result_data = response_query_result["ResultSet"]
+
+        if len(result_data["Rows"]) > 1:
+            header = result_data["Rows"][0]
+            rows = result_data["Rows"][1:]
+
+            header = [obj["VarCharValue"] for obj in header["Data"]]
+            return [dict(zip(header, self.get_var_char_values(row))) for row in rows]
+        else:
+            return []
+
     def query_results(self, session, params, wait=True):
-        client = session.client("athena")
+        client = self.get_client(session, "athena")
 
-        # This function executes the query and returns the query execution ID
-        response_query_execution_id = client.start_query_execution(
-            QueryString=params["query"],
-            QueryExecutionContext={"Database": "default"},
-            ResultConfiguration={
+        query_execution = {
+            "QueryString": params["query"],
+            "QueryExecutionContext": {"Database": "default"},
+            "ResultConfiguration": {
                 "OutputLocation": "s3://" + params["bucket"] + "/" + params["path"]
             },
-        )
+        }
+
+        # Reuse results of an identical query (Athena engine v3, SELECT only)
+        if params.get("result_reuse_minutes"):
+            query_execution["ResultReuseConfiguration"] = {
+                "ResultReuseByAgeConfiguration": {
+                    "Enabled": True,
+                    "MaxAgeInMinutes": params["result_reuse_minutes"],
+                }
+            }
+
+        # This function executes the query and returns the query execution ID
+        response_query_execution_id = client.start_query_execution(**query_execution)
 
         if not wait:
             return response_query_execution_id["QueryExecutionId"]
 
         else:
+            return self.wait_results(
+                session, response_query_execution_id["QueryExecutionId"]
+            )
 
+    def wait_results(self, session, query_execution_id):
+        client = self.get_client(session, "athena")
+
+        deadline = time.monotonic() + 1800  # 30 mins
+        delay = 0.05
+
+        print(f"Query in progress...")
+
+        while time.monotonic() < deadline:
             response_get_query_details = client.get_query_execution(
-                QueryExecutionId=response_query_execution_id["QueryExecutionId"]
+                QueryExecutionId=query_execution_id
             )
-            status = "RUNNING"
-            iterations = 360  # 30 mins
-
-            while iterations > 0:
-                iterations = iterations - 1
-                response_get_query_details = client.get_query_execution(
-                    QueryExecutionId=response_query_execution_id["QueryExecutionId"]
-                )
-                status = response_get_query_details["QueryExecution"]["Status"]["State"]
-
-                if (status == "FAILED") or (status == "CANCELLED"):
-                    failure_reason = response_get_query_details["QueryExecution"][
-                        "Status"
-                    ]["StateChangeReason"]
-                    print(failure_reason)
-                    return False, False
-
-                elif status == "SUCCEEDED":
-                    location = response_get_query_details["QueryExecution"][
-                        "ResultConfiguration"
-                    ]["OutputLocation"]
-
-                    # Function to get output results
-                    response_query_result = client.get_query_results(
-                        QueryExecutionId=response_query_execution_id["QueryExecutionId"]
-                    )
-                    result_data = response_query_result["ResultSet"]
-
-                    if len(result_data["Rows"]) > 1:
-                        header = response_query_result["ResultSet"]["Rows"][0]
-                        rows = response_query_result["ResultSet"]["Rows"][1:]
-
-                        header = [obj["VarCharValue"] for obj in header["Data"]]
-                        result = [
-                            dict(zip(header, self.get_var_char_values(row)))
-                            for row in rows
-                        ]
-
-                        # print(f'Results : {result}')
-
-                        return location, result
-                    else:
-                        # print(f'Results : None')
-                        return location, None
+            status = response_get_query_details["QueryExecution"]["Status"]["State"]
+
+            if (status == "FAILED") or (status == "CANCELLED"):
+                failure_reason = response_get_query_details["QueryExecution"]["Status"][
+                    "StateChangeReason"
+                ]
+                print(failure_reason)
+                return False, False
+
+            elif status == "SUCCEEDED":
+                location = response_get_query_details["QueryExecution"][
+                    "ResultConfiguration"
+                ]["OutputLocation"]
+
+                # Function to get output results
+                # DDL statements write a .txt manifest, only SELECT results are CSV
+                result = None
+                if location.endswith(".csv"):
+                    try:
+                        result = self.get_csv_results(session, location)
+                    except ClientError as err:
+                        print(f"Unable to read {location}, falling back to API: {err}")
+
+                if result is None:
+                    result = self.get_api_results(client, query_execution_id)
+
+                if len(result) > 0:
+                    # print(f'Results : {result}')
+
+                    return location, result
                 else:
-                    print(f"Query in progress...")
-                    time.sleep(5)
-
-            return False
+                    # print(f'Results : None')
+                    return location, None
+            else:
+                # Short queries return quickly, long ones poll at most once per second
+                time.sleep(delay)
+                delay = min(delay * 1.5, 1.0)
+
+        return False, False
@@ -1,56 +1,30 @@
 import boto3
+import functools
+import hashlib
 import os
+import string
+import time
 from athena_from_s3 import AthenaHelper
+from botocore.config import Config
+from botocore.exceptions import ClientError
 
 
-s3_location_bucket = os.environ
+## fail on cold start rather than building malformed S3 URIs
+for variable in ("s3_location_bucket", "s3_query_results_bucket"):
+    if not os.environ.get(variable):
+        raise ValueError(f"Environment variable {variable} must be set to a bucket name")
+
+s3_location_bucket = os.environ["s3_location_bucket"]
 s3_location_prefix = "AWSLogs/"
 s3_location = f"s3://{s3_location_bucket}/{s3_location_prefix}"
 s3_query_results_bucket = os.environ["s3_query_results_bucket"]
 s3_query_results_prefix = "temp/athena/output"
+s3_table_hash_key = "temp/athena/meta/cloudtrail_logs.hash"
 isorg = True
-
-def lambda_handler(event, context):
-    regions = get_regions()
-    accounts = list_account_partition()
-    query = generate_table_query(accounts, regions)
-    update_table_query(query)
-
-
-def get_regions():
-    account_client = boto3.client('account')
-
-    regions = []
-
-    paginator = account_client.get_paginator('list_regions')
-
-    for page in paginator.paginate():
-        for region in page['Regions']:
-            regions.append(region['RegionName'])
-
-    return regions
-
-def list_account_partition():
-    s3_client = boto3.client('s3')
-    
-    accounts_list = []
-
-    response = s3_client.list_objects_v2(
-        Bucket=s3_location_bucket,
-        Prefix=s3_location_prefix,
-        Delimiter='/'
-    )
-
-    account_index = 2 if isorg else 1
-
-    for prefix in response["CommonPrefixes"]:
-        account = prefix['Prefix'].split('/')[account_index]
-        accounts_list.append(account)
-
-    return accounts_list
-
-def generate_table_query(accounts, regions):
-  query = f'CREATE EXTERNAL TABLE cloudtrail_logs ( \n\
+client_config = Config(tcp_keepalive=True, max_pool_connections=50, retries={'mode': 'standard'})
+regions_cache_ttl = 86400  # 1 day
+regions_cache = {"regions": None, "timestamp": 0}
+table_query_template = string.Template('CREATE EXTERNAL TABLE cloudtrail_logs ( \n\
         eventversion string, \n\
         useridentity struct<type:string,principalid:string,arn:string,accountid:string,invokedby:string,accesskeyid:string,username:string,sessioncontext:struct<attributes:struct<mfaauthenticated:string,creationdate:string>,sessionissuer:struct<type:string,principalid:string,arn:string,accountid:string,username:string>>>, \n\
         eventtime string, \n\
@@ -81,27 +55,128 @@ def generate_table_query(accounts, regions):
     ROW FORMAT SERDE \'com.amazon.emr.hive.serde.CloudTrailSerde\' \n\
     STORED AS INPUTFORMAT \'com.amazon.emr.cloudtrail.CloudTrailInputFormat\' \n\
     OUTPUTFORMAT \'org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat\' \n\
-    LOCATION \'{s3_location}\' \n\
+    LOCATION \'$s3_location\' \n\
     TBLPROPERTIES ( \n\
         \'projection.account.type\'=\'enum\', \n\
-        \'projection.account.values\'=\'{",".join(accounts)}\', \n\
+        \'projection.account.values\'=\'$accounts\', \n\
         \'projection.enabled\'=\'true\', \n\
         \'projection.region.type\'=\'enum\', \n\
-        \'projection.region.values\'=\'{",".join(regions)}\', \n\
+        \'projection.region.values\'=\'$regions\', \n\
         \'projection.timestamp.format\'=\'yyyy/MM/dd\', \n\
         \'projection.timestamp.interval\'=\'1\', \n\
         \'projection.timestamp.interval.unit\'=\'DAYS\', \n\
         \'projection.timestamp.range\'=\'2020/01/01,NOW\', \n\
         \'projection.timestamp.type\'=\'date\', \n\
-        \'storage.location.template\'=\'{s3_location}${{account}}/CloudTrail/${{region}}/${{timestamp}}\' \n\
-    )'
-  
-  return query
+        \'storage.location.template\'=\'$s3_location$${account}/CloudTrail/$${region}/$${timestamp}\' \n\
+    )')
+
+def lambda_handler(event, context):
+    regions = get_regions()
+    accounts = list_account_partition()
+    query = generate_table_query(accounts, regions)
+    update_table_query(query)
+
+
+def get_regions():
+    ## regions rarely change, reuse the list across warm invocations
+    if regions_cache["regions"] is not None and time.time() - regions_cache["timestamp"] < regions_cache_ttl:
+        return regions_cache["regions"]
+
+    account_client = boto3.client('account', config=client_config)
+
+    regions = []
+
+    paginator = account_client.get_paginator('list_regions')
+
+    for page in paginator.paginate():
+        for region in page['Regions']:
+            regions.append(region['RegionName'])
+
+    regions_cache["regions"] = regions
+    regions_cache["timestamp"] = time.time()
+
+    return regions
+
+def list_account_partition():
+    s3_client = boto3.client('s3', config=client_config)
+    
+    accounts_list = []
+
+    paginator = s3_client.get_paginator('list_objects_v2')
+
+    account_index = 2 if isorg else 1
+
+    for page in paginator.paginate(
+        Bucket=s3_location_bucket,
+        Prefix=s3_location_prefix,
+        Delimiter='/'
+    ):
+        for prefix in page.get("CommonPrefixes", []):
+            account = prefix['Prefix'].split('/')[account_index]
+            accounts_list.append(account)
+
+    return accounts_list
+
+def generate_table_query(accounts, regions):
+    return build_table_query(tuple(sorted(accounts)), tuple(sorted(regions)))
+
+@functools.lru_cache(maxsize=4)
+def build_table_query(accounts, regions):
+    query = table_query_template.substitute(
+        s3_location=s3_location,
+        accounts=",".join(accounts),
+        regions=",".join(regions),
+    )
+
+    return query
+
+def get_table_hash():
+    s3_client = boto3.client('s3', config=client_config)
+
+    try:
+        response = s3_client.get_object(Bucket=s3_query_results_bucket, Key=s3_table_hash_key)
+    except ClientError as err:
+        ## without s3:ListBucket a missing object is reported as AccessDenied
+        if err.response["Error"]["Code"] in ("NoSuchKey", "404", "AccessDenied", "403"):
+            return None
+        raise err
+
+    return response["Body"].read().decode("utf-8")
+
+def table_exists(athena_client):
+    try:
+        athena_client.get_table_metadata(
+            CatalogName='AwsDataCatalog',
+            DatabaseName='default',
+            TableName='cloudtrail_logs'
+        )
+    except ClientError as err:
+        if err.response["Error"]["Code"] == "MetadataException":
+            return False
+        raise err
+
+    return True
+
+def put_table_hash(table_hash):
+    s3_client = boto3.client('s3', config=client_config)
+
+    s3_client.put_object(
+        Bucket=s3_query_results_bucket,
+        Key=s3_table_hash_key,
+        Body=table_hash.encode("utf-8")
+    )
 
 def update_table_query(query):
+    ## Skip DROP/CREATE when the table still exists and its definition did not change since last run
+    table_hash = hashlib.blake2b(query.encode("utf-8")).hexdigest()
+
     session = boto3.Session()
     athena_helper = AthenaHelper()
 
+    if get_table_hash() == table_hash and table_exists(athena_helper.get_client(session, "athena")):
+        print("Table definition unchanged")
+        return
+
     ## DROP TABLE
     print("Dropping table")
     params = {
@@ -109,14 +184,20 @@ def update_table_query(query):
         "database": "default",
         "bucket": s3_query_results_bucket,
         "path": s3_query_results_prefix,
-        "query": "DROP TABLE cloudtrail_logs",
+        "query": "DROP TABLE IF EXISTS cloudtrail_logs",
     }
-    athena_helper.query_results(session, params)
+    drop_query_id = athena_helper.query_results(session, params, wait=False)
 
     ## CREATE TABLE
+    ## Athena only accepts the CREATE once the DROP has completed
+    athena_helper.wait_results(session, drop_query_id)
     print("Creating table")
-    params["query"] = query
-    athena_helper.query_results(session, params)
+    params = dict(params, query=query)
+    create_query_id = athena_helper.query_results(session, params, wait=False)
+    location, _ = athena_helper.wait_results(session, create_query_id)
+
+    if location:
+        put_table_hash(table_hash)
 
 
 if __name__ == "__main__":
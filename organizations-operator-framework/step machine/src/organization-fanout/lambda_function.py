@@ -1,4 +1,5 @@
 import os
+import time
 import uuid
 import boto3
 
@@ -15,45 +16,50 @@ def lambda_handler(event, context):
     return result
 
 def fetch_organization_accounts(organizations):
-    result = {
-        "AccountRegions" : []
-    }
-
     paginator = organizations.get_paginator('list_accounts')
+    accounts = paginator.paginate().build_full_result()['Accounts']
 
-    for page in paginator.paginate():
-        for account in page['Accounts']:
-
-            account_id = account['Id']
-            account_name = account['Name']
-            account_status = account['Status']
-
-            for region in operated_regions:
-                result['AccountRegions'].append({
-                    "accountId" : account_id,
-                    "accountName" : account_name,
-                    "accountStatus" : account_status,
-                    "region" : region
-                })
+    result = {
+        "AccountRegions" : [
+            {
+                "accountId" : account['Id'],
+                "accountName" : account['Name'],
+                "accountStatus" : account['Status'],
+                "region" : region
+            }
+            for account in accounts
+            for region in operated_regions
+        ]
+    }
 
     return result
 
 ##########################
 ### Session management ###
 ##########################
+sts = boto3.client("sts")
+session_cache = {}
+session_expiration_margin = 300  # refresh 5 mins before credentials expire
+
 def assume_role(account_id):
-    client = boto3.client("sts")
+    ## reuse the assumed session across warm invocations
+    cached = session_cache.get(account_id)
+    if cached and cached[0] - time.time() > session_expiration_margin:
+        return cached[1]
 
-    response = client.assume_role(
+    response = sts.assume_role(
         RoleArn=f'arn:aws:iam::{account_id}:role/operation-readonly',
         RoleSessionName=str(uuid.uuid4()),
     )
 
-    return boto3.Session(
+    session = boto3.Session(
         aws_access_key_id=response["Credentials"]["AccessKeyId"],
         aws_secret_access_key=response["Credentials"]["SecretAccessKey"],
         aws_session_token=response["Credentials"]["SessionToken"],
     )
+    session_cache[account_id] = (response["Credentials"]["Expiration"].timestamp(), session)
+
+    return session
 
 ##############################
 ### END Session management ###
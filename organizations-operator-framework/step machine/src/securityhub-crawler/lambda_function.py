@@ -1,8 +1,11 @@
 import boto3
 import botocore
 import os
+import time
 import uuid
 import json
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
 
 def lambda_handler(event, context):
 
@@ -53,29 +56,27 @@ def fetch_security_hub_configuration(securityhub, result):
         ## STANDARDS
         paginator = securityhub.get_paginator("get_enabled_standards")
 
+        subscriptions = paginator.paginate().build_full_result().get("StandardsSubscriptions", [])
+
+        ## get number of enabled controls, one standard per worker
         standards = []
-        for page in paginator.paginate():
-            if "StandardsSubscriptions" in page:
-                for subscription in page["StandardsSubscriptions"]:
-                    standard_subscription_arn = subscription["StandardsSubscriptionArn"]
-                    standard_arn = subscription["StandardsArn"]
-                    arn_part_1 = standard_arn.split("/")[0]
-                    standard_name = standard_arn.replace(arn_part_1 + "/", "")
-
-                    ## get number of enabled controls
-                    nb_enabled_controls = 0
-                    paginator2 = securityhub.get_paginator('describe_standards_controls')
-                    for page2 in paginator2.paginate(StandardsSubscriptionArn=standard_subscription_arn):
-                        if 'Controls' in page2:
-                            for control in page2['Controls']:
-                                if control['ControlStatus'] == 'ENABLED':
-                                    nb_enabled_controls += 1
-
-                    standards.append({
-                        "name": standard_name,
-                        "nbEnabledControls": nb_enabled_controls,
-                    })
-        standards.sort(key=lambda x: x["name"])
+        if subscriptions:
+            with ThreadPoolExecutor(max_workers=min(8, len(subscriptions))) as executor:
+                enabled_controls = list(executor.map(
+                    lambda subscription: count_enabled_controls(securityhub, subscription["StandardsSubscriptionArn"]),
+                    subscriptions
+                ))
+
+            for subscription, nb_enabled_controls in zip(subscriptions, enabled_controls):
+                standard_arn = subscription["StandardsArn"]
+                arn_part_1 = standard_arn.split("/")[0]
+                standard_name = standard_arn.replace(arn_part_1 + "/", "")
+
+                standards.append({
+                    "name": standard_name,
+                    "nbEnabledControls": nb_enabled_controls,
+                })
+        standards.sort(key=itemgetter("name"))
         result["standards"] = json.dumps(standards)
 
     ## MASTER
@@ -86,23 +87,43 @@ def fetch_security_hub_configuration(securityhub, result):
 
     return result
 
+def count_enabled_controls(securityhub, standard_subscription_arn):
+    paginator = securityhub.get_paginator('describe_standards_controls')
+
+    return sum(
+        1
+        for page in paginator.paginate(StandardsSubscriptionArn=standard_subscription_arn)
+        for control in page.get('Controls', ())
+        if control['ControlStatus'] == 'ENABLED'
+    )
+
 
 ##########################
 ### Session management ###
 ##########################
+sts = boto3.client("sts")
+session_cache = {}
+session_expiration_margin = 300  # refresh 5 mins before credentials expire
+
 def assume_role(account_id):
-    client = boto3.client("sts")
+    ## reuse the assumed session across warm invocations
+    cached = session_cache.get(account_id)
+    if cached and cached[0] - time.time() > session_expiration_margin:
+        return cached[1]
 
-    response = client.assume_role(
+    response = sts.assume_role(
         RoleArn=f'arn:aws:iam::{account_id}:role/operation-readonly',
         RoleSessionName=str(uuid.uuid4()),
     )
 
-    return boto3.Session(
+    session = boto3.Session(
         aws_access_key_id=response["Credentials"]["AccessKeyId"],
         aws_secret_access_key=response["Credentials"]["SecretAccessKey"],
         aws_session_token=response["Credentials"]["SessionToken"],
     )
+    session_cache[account_id] = (response["Credentials"]["Expiration"].timestamp(), session)
+
+    return session
 
 
 ##############################
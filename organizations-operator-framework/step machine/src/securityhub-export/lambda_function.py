@@ -1,10 +1,17 @@
 import boto3
+import csv
 import os
-import pandas
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from operator import itemgetter
 
 bucket_name = os.environ['BUCKET_NAME']
 table_name = os.environ['TABLE_NAME']
+scan_segments = 4
+
+dynamodb = boto3.client('dynamodb')
+s3client = boto3.client('s3')
 
 def lambda_handler(event, context):
 
@@ -16,18 +23,31 @@ def lambda_handler(event, context):
 
 ## load data ##
 def load_data():
-    dynamodb = boto3.client('dynamodb')
+    with ThreadPoolExecutor(max_workers=scan_segments) as executor:
+        segments = executor.map(scan_segment, range(scan_segments))
+        data = list(chain.from_iterable(segments))
+
+    data = sorted(data, key=itemgetter("accountId", "region"))
+
+    return data
+
+def scan_segment(segment):
+    ## one segment per worker, the client is shared as boto3 clients are thread-safe
     paginator = dynamodb.get_paginator('scan')
 
-    data = []
+    items = []
 
-    for page in paginator.paginate(TableName=table_name):
+    for page in paginator.paginate(
+        TableName=table_name,
+        Segment=segment,
+        TotalSegments=scan_segments,
+        ProjectionExpression="accountId, #region, accountStatus, #status, masterAccountId, standards",
+        ExpressionAttributeNames={"#region": "region", "#status": "status"},
+    ):
         for item in page['Items']:
-            data.append(convert_to_json(item))
-
-    data = sorted(data, key=lambda k: (k["accountId"], k["region"]))
+            items.append(convert_to_json(item))
 
-    return data
+    return items
 
 def convert_to_json(item):
     return {
@@ -43,21 +63,21 @@ def convert_to_json(item):
 def create_file(data):
     filename = str(uuid.uuid4()) + '.csv'
     filepath = f'/tmp/{filename}'
-    dataframe = pandas.DataFrame(data = data)
-    dataframe.to_csv(
-        filepath,
-        columns=['accountId', 'region', 'accountStatus', 'status', 'masterAccountId', 'standards']
-    )
+    with open(filepath, 'w', newline='') as file:
+        writer = csv.DictWriter(
+            file,
+            fieldnames=['accountId', 'region', 'accountStatus', 'status', 'masterAccountId', 'standards']
+        )
+        writer.writeheader()
+        writer.writerows(data)
     return filepath, filename
 
 
 ## export to s3 ##
 def upload_to_s3(filepath, filename):
-    s3resource = boto3.resource('s3')
-    s3client = boto3.client('s3')
     try:
         s3key = 'reporting/accesskeys/' + filename
-        s3resource.meta.client.upload_file(
+        s3client.upload_file(
             filepath,
             bucket_name,
             s3key